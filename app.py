@@ -1,7 +1,8 @@
 import streamlit as st
 from src.DocumentChatbot import DocumentChatbot
-import os
-import tempfile
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Initialize session state with a DocumentChatbot instance and conversation messages
 if 'chatbot' not in st.session_state:
@@ -10,27 +11,41 @@ if 'chatbot' not in st.session_state:
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
+if 'current_file_hash' not in st.session_state:
+    st.session_state.current_file_hash = None
+
+# Each session indexes its uploads on its own worker, so one large PDF doesn't block other users
+if 'executor' not in st.session_state:
+    st.session_state.executor = ThreadPoolExecutor(max_workers=1)
+
 st.title("Document Chatbot")
 
 # File upload section
 uploaded_file = st.file_uploader("Upload a document", type=['pdf'])
-if uploaded_file:    
-    # Create a temporary file to save the uploaded content
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        # Write the uploaded file content to the temporary file
-        tmp_file.write(uploaded_file.getvalue())
-        tmp_file_path = tmp_file.name
-    
-    try:
-        # Load the document using the temporary file path
-        st.session_state.chatbot.load_document(tmp_file_path)
-        st.success("Document loaded successfully!")
-    except Exception as e:
-        # Display an error message if document loading fails
-        st.error(f"Error loading document: {str(e)}")
-    finally:
-        # Clean up the temporary file to avoid storing unnecessary files on disk
-        os.unlink(tmp_file_path)
+if uploaded_file:
+    pdf_bytes = uploaded_file.getvalue()
+
+    # Only (re)load the document when its contents change, not on every rerun
+    file_hash = hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+    if file_hash != st.session_state.current_file_hash:
+        with st.status("Indexing document...", expanded=True) as status:
+            # Embed and index the uploaded bytes on a background thread while the status keeps updating
+            future = st.session_state.executor.submit(
+                st.session_state.chatbot.load_document_from_bytes, pdf_bytes, source=uploaded_file.name
+            )
+            elapsed = st.empty()
+            start = time.monotonic()
+            while not future.done():
+                elapsed.write(f"Embedding and indexing... {time.monotonic() - start:.0f}s")
+                time.sleep(0.2)
+
+            try:
+                future.result()
+                st.session_state.current_file_hash = file_hash
+                status.update(label="Document loaded successfully!", state="complete", expanded=False)
+            except Exception as e:
+                # Display an error message if document loading fails
+                status.update(label=f"Error loading document: {str(e)}", state="error")
 
 # Display chat interface and conversation history
 for message in st.session_state.messages:
@@ -46,10 +61,9 @@ if prompt := st.chat_input("Ask a question about the document"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Get bot response to the user's query
-    response = st.session_state.chatbot.process_query(prompt)
+    # Stream the bot response to the user's query as it is generated
+    with st.chat_message("assistant"):
+        response = st.write_stream(st.session_state.chatbot.stream_query(prompt))
 
-    # Add assistant's response to chat history and display it
+    # Add assistant's response to chat history
     st.session_state.messages.append({"role": "assistant", "content": response})
-    with st.chat_message("assistant"):
-        st.markdown(response)
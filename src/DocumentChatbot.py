@@ -1,39 +1,306 @@
 import os
 import re
 import sys
+import shutil
+import hashlib
+import tempfile
+import threading
+import functools
+from operator import itemgetter
 from datetime import datetime
 from dateutil import parser
 import phonenumbers
+import ahocorasick
+import numpy as np
+import torch
+import faiss
+import fitz
+import torch.nn.functional as F
+from transformers import AutoModel, AutoTokenizer
 
 from langchain_ollama import OllamaLLM
-from langchain_community.vectorstores import Chroma
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.chains import ConversationalRetrievalChain
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableBranch, RunnablePassthrough
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+# Leave half the cores to Streamlit and Ollama; MiniLM on CPU is memory-bound and gains little from more threads
+torch.set_num_threads(max(1, (os.cpu_count() or 1) // 2))
+try:
+    if torch.get_num_interop_threads() != 1:
+        torch.set_num_interop_threads(1)
+except RuntimeError:
+    # The inter-op pool is already running (e.g. Streamlit re-imported this module); keep its size
+    pass
+
+_EMAIL_RE = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+
+# Keywords that route a query to call scheduling, matched in one pass with an Aho-Corasick automaton
+_SCHEDULING_KEYWORDS = ahocorasick.Automaton()
+for _keyword in ["call me", "contact me", "schedule", "appointment"]:
+    _SCHEDULING_KEYWORDS.add_word(_keyword, _keyword)
+_SCHEDULING_KEYWORDS.make_automaton()
+
+# Common date formats tried with strptime before falling back to dateutil's fuzzy parser
+_DATE_FORMATS = [
+    (re.compile(r'^\d{4}-\d{1,2}-\d{1,2}$'), "%Y-%m-%d"),
+    (re.compile(r'^\d{1,2}/\d{1,2}/\d{4}$'), "%d/%m/%Y"),
+    (re.compile(r'^[A-Za-z]{3} \d{1,2}, \d{4}$'), "%b %d, %Y"),
+]
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_known_date_format(date_string):
+    """
+    Parse a date written in one of the common formats in _DATE_FORMATS.
+
+    Results do not depend on the current date, so they are safe to cache.
+
+    Args:
+        date_string (str): The stripped date string provided by the user.
+
+    Returns:
+        str or None: The date as YYYY-MM-DD, or None if it matches no known format.
+    """
+    for pattern, date_format in _DATE_FORMATS:
+        if pattern.match(date_string):
+            try:
+                return datetime.strptime(date_string, date_format).strftime("%Y-%m-%d")
+            except ValueError:
+                return None
+    return None
+
+# Rewrites a follow-up into a standalone question before retrieval
+_CONDENSE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language. Return only the question."),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+# Answers the standalone question from the retrieved chunks; the history is already folded into the question
+_ANSWER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.\n\n{context}"),
+    ("human", "{question}"),
+])
+
+
+class MiniLMEmbeddings(Embeddings):
+    """
+    Sentence embeddings from all-MiniLM-L6-v2, tokenizing and encoding each batch of texts in a single call.
+    """
+
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", batch_size=64, max_length=256):
+        """
+        Load the tokenizer and transformer model.
+
+        Args:
+            model_name (str): The Hugging Face model to load.
+            batch_size (int): Number of texts encoded per forward pass.
+            max_length (int): Maximum number of tokens kept per text.
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Fast tokenizers are not safe to call from several threads at once
+        self._tokenizer_lock = threading.Lock()
+        self.model = AutoModel.from_pretrained(model_name).to(self.device).eval()
+
+    def count_tokens(self, text):
+        """
+        Count the wordpiece tokens in a text, excluding the [CLS] and [SEP] special tokens.
+
+        Args:
+            text (str): The text to measure.
+
+        Returns:
+            int: The number of tokens.
+        """
+        with self._tokenizer_lock:
+            return len(self.tokenizer.tokenize(text))
+
+    @torch.inference_mode()
+    def _encode(self, texts):
+        with self._tokenizer_lock:
+            inputs = self.tokenizer(
+                texts,
+                padding='longest',
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors='pt'
+            )
+        inputs = inputs.to(self.device)
+        token_embeddings = self.model(**inputs).last_hidden_state
+
+        # Mean-pool over real tokens, ignoring padding
+        mask = inputs['attention_mask'].unsqueeze(-1).to(token_embeddings.dtype)
+        embeddings = (token_embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return F.normalize(embeddings, p=2, dim=1).cpu().numpy()
+
+    def embed_array(self, texts):
+        """
+        Embed a list of texts in batches, keeping the result as a single array.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            numpy.ndarray: A float32 array with one normalized embedding per row.
+        """
+        embeddings = np.empty((len(texts), self.model.config.hidden_size), dtype=np.float32)
+        # Batch texts of similar length together to minimize padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            embeddings[batch] = self._encode([texts[i] for i in batch])
+        return embeddings
+
+    def embed_documents(self, texts):
+        """
+        Embed a list of texts in batches.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            list[list[float]]: One normalized embedding per text.
+        """
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        """
+        Embed a single query.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            list[float]: The normalized query embedding.
+        """
+        return self._encode([text])[0].tolist()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_embeddings():
+    """
+    Load the embedding model once per process and share it across DocumentChatbot instances.
+
+    Returns:
+        MiniLMEmbeddings: The cached embedding model.
+    """
+    return MiniLMEmbeddings()
+
 
 class DocumentChatbot:
     def __init__(self):
         """
-        Initialize the DocumentChatbot with embedding models and placeholders for conversation history and user information.
+        Initialize the DocumentChatbot with embedding models, the LLM, conversation memory and a placeholder for user information.
         """
-        self.conversation_history = []
         self.user_info = {}
+        self.document_digest = None
         
         # Initialize embeddings with error handling
         try:
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="all-MiniLM-L6-v2",
-                model_kwargs={'device': 'cpu'}
-            )
+            self.embeddings = _get_embeddings()
         except ImportError as e:
             print("Error: Required packages not installed.")
-            print("Please run: pip install sentence-transformers transformers torch")
+            print("Please run: pip install transformers torch")
             sys.exit(1)
         except Exception as e:
             print(f"Error initializing embeddings: {str(e)}")
             sys.exit(1)
-        
+
+        # Initialize the 'llama3.2:3b-instruct-q4_K_M' LLM using Ollama, shared by every loaded document
+        self.llm = OllamaLLM(model="llama3.2:3b-instruct-q4_K_M")
+
+        # Keep recent turns verbatim and summarize older ones so the prompt stays bounded
+        self.memory = ConversationSummaryBufferMemory(
+            llm=self.llm,
+            max_token_limit=1024,
+            memory_key="chat_history",
+            input_key="question",
+            output_key="answer",
+            return_messages=True
+        )
+
+    def _build_index(self, vectors):
+        """
+        Build an HNSW index over 8-bit scalar-quantized vectors, trained on the document embeddings.
+
+        Embeddings are normalized, so inner product is equivalent to cosine similarity.
+
+        Args:
+            vectors (numpy.ndarray): The float32 document embeddings used to train the quantizer.
+
+        Returns:
+            faiss.IndexHNSWSQ: The trained HNSW index with tuned construction and search parameters.
+        """
+        index = faiss.IndexHNSWSQ(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, 24, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 128
+        index.hnsw.efSearch = 100
+        index.train(vectors)
+        return index
+
+    def _persist_directory(self, digest):
+        """
+        Build the on-disk location of a document's vector store.
+
+        The name includes the embedding model, chunk size and index type, so indexes built with a
+        different configuration are never reused.
+
+        Args:
+            digest (str): Hash of the PDF contents.
+
+        Returns:
+            str: The directory the vector store is saved to and loaded from.
+        """
+        model = self.embeddings.model_name.rsplit('/', 1)[-1]
+        chunk_size = self.embeddings.max_length - 2
+        return f"DB/{model}-c{chunk_size}-hnswsq8-{digest}"
+
+    @staticmethod
+    def _is_saved(persist_directory):
+        """
+        Check whether a complete vector store exists on disk.
+
+        Args:
+            persist_directory (str): The directory the vector store is saved to.
+
+        Returns:
+            bool: True if both files written by save_local are present, False otherwise.
+        """
+        return all(os.path.exists(os.path.join(persist_directory, name)) for name in ("index.faiss", "index.pkl"))
+
+    def _save_vectorstore(self, persist_directory):
+        """
+        Save the vector store to a temporary directory and move it into place, so an interrupted
+        save never leaves a partial store at persist_directory.
+
+        Args:
+            persist_directory (str): The directory the vector store is saved to.
+        """
+        parent = os.path.dirname(persist_directory)
+        os.makedirs(parent, exist_ok=True)
+        tmp_directory = tempfile.mkdtemp(dir=parent)
+        try:
+            self.vectorstore.save_local(tmp_directory)
+            # Clear any partial store left behind by an earlier failed save
+            shutil.rmtree(persist_directory, ignore_errors=True)
+            os.replace(tmp_directory, persist_directory)
+        except Exception:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            # Another session may have saved the same document first
+            if not self._is_saved(persist_directory):
+                raise
+
     def load_document(self, pdf_path):
         """
         Load and process a PDF document into a vector store for conversational retrieval.
@@ -45,41 +312,13 @@ class DocumentChatbot:
             # Verify file exists
             if not os.path.exists(pdf_path):
                 raise FileNotFoundError(f"PDF file not found at: {pdf_path}")
-            
-            persist_directory = f"DB/chroma_{datetime.now()}"
-            # Load PDF
-            loader = PyPDFLoader(pdf_path)
-            documents = loader.load()
-            
-            # Split text into chunks
-            text_splitter = CharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            docs = text_splitter.split_documents(documents)
-            
-            if not docs:
-                raise ValueError("No text content extracted from PDF")
-            
-            # Create Chroma vector store
-            self.vectorstore = Chroma.from_documents(
-                documents=docs,
-                embedding=self.embeddings,
-                persist_directory=persist_directory,
-            )
-            
-            # Initialize the 'llama3.2:3b-instruct-q4_K_M' LLM using Ollama
-            llm = OllamaLLM(model="llama3.2:3b-instruct-q4_K_M")
-            
-            # Create conversation chain
-            self.qa_chain = ConversationalRetrievalChain.from_llm(
-                llm=llm,
-                retriever=self.vectorstore.as_retriever(),
-                return_source_documents=True
-            )
-            
+
+            with open(pdf_path, 'rb') as pdf_file:
+                pdf_bytes = pdf_file.read()
+
+            self.load_document_from_bytes(pdf_bytes, source=pdf_path)
             print("Document loaded successfully!")
-            
+
         except FileNotFoundError as e:
             print(f"Error: {str(e)}")
             sys.exit(1)
@@ -87,7 +326,94 @@ class DocumentChatbot:
             print(f"Error processing document: {str(e)}")
             sys.exit(1)
 
-    def validate_email(self, email):
+    def load_document_from_bytes(self, pdf_bytes, source="uploaded.pdf"):
+        """
+        Load and process an in-memory PDF document into a vector store for conversational retrieval.
+
+        Args:
+            pdf_bytes (bytes): The raw contents of the PDF document.
+            source (str): Name recorded as the source of each page in the document metadata.
+
+        Raises:
+            ValueError: If no text could be extracted from the PDF.
+        """
+        # Key the persisted index on the PDF contents so repeat uploads skip parsing and embedding
+        digest = hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+        if digest == self.document_digest:
+            # Same document is already loaded; keep the current vector store and chain
+            return
+        persist_directory = self._persist_directory(digest)
+
+        if self._is_saved(persist_directory):
+            # Reuse the previously built FAISS vector store
+            self.vectorstore = FAISS.load_local(
+                persist_directory,
+                self.embeddings,
+                allow_dangerous_deserialization=True,
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+            )
+        else:
+            # Load PDF pages straight from memory
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+                documents = [
+                    Document(page_content=page.get_text(), metadata={"source": source, "page": i})
+                    for i, page in enumerate(pdf)
+                ]
+
+            # Split text into chunks sized in tokens of the embedding model; the splitter does not
+            # count [CLS] and [SEP], so leave room for them within the model's max_length
+            text_splitter = RecursiveCharacterTextSplitter(
+                length_function=self.embeddings.count_tokens,
+                chunk_size=self.embeddings.max_length - 2,
+                chunk_overlap=32
+            )
+            docs = text_splitter.split_documents(documents)
+
+            if not docs:
+                raise ValueError("No text content extracted from PDF")
+
+            # Embed once up front: the quantizer is trained on the same vectors that are indexed
+            texts = [doc.page_content for doc in docs]
+            vectors = self.embeddings.embed_array(texts)
+
+            # Create FAISS vector store backed by a tuned, int8-quantized HNSW index
+            self.vectorstore = FAISS(
+                embedding_function=self.embeddings,
+                index=self._build_index(vectors),
+                docstore=InMemoryDocstore(),
+                index_to_docstore_id={},
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+            )
+            self.vectorstore.add_embeddings(
+                zip(texts, vectors),
+                metadatas=[doc.metadata for doc in docs]
+            )
+            self._save_vectorstore(persist_directory)
+
+        # Create the retriever once per document.
+        # MMR drops near-duplicate chunks so fewer, more diverse chunks reach the prompt.
+        self.retriever = self.vectorstore.as_retriever(
+            search_type='mmr',
+            search_kwargs={'k': 3, 'fetch_k': 20, 'lambda_mult': 0.5}
+        )
+
+        # Condense follow-ups into a standalone question; the first turn is used as-is
+        condense_question = RunnableBranch(
+            (lambda inputs: not inputs["chat_history"], itemgetter("input")),
+            _CONDENSE_PROMPT | self.llm | StrOutputParser()
+        )
+
+        # Create conversation chain; it streams, so every query path goes through it
+        self.qa_chain = (
+            RunnablePassthrough.assign(question=condense_question)
+            .assign(context=itemgetter("question") | self.retriever)
+            .assign(answer=create_stuff_documents_chain(self.llm, _ANSWER_PROMPT))
+        )
+        self.document_digest = digest
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def validate_email(email):
         """
         Validate email format using a regex pattern.
 
@@ -97,10 +423,11 @@ class DocumentChatbot:
         Returns:
             bool: True if the email format is valid, False otherwise.
         """
-        pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
-        return re.match(pattern, email) is not None
+        return _EMAIL_RE.match(email) is not None
 
-    def validate_phone(self, phone):
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def validate_phone(phone):
         """
         Validate phone number using the phonenumbers library.
 
@@ -116,7 +443,8 @@ class DocumentChatbot:
         except:
             return False
 
-    def parse_date(self, date_string):
+    @staticmethod
+    def parse_date(date_string):
         """
         Convert natural language date expressions into a standardized format (YYYY-MM-DD).
 
@@ -126,8 +454,13 @@ class DocumentChatbot:
         Returns:
             str or None: The formatted date string if parsed successfully, otherwise None.
         """
+        parsed_date = _parse_known_date_format(date_string.strip())
+        if parsed_date:
+            return parsed_date
+
+        # dateutil fills missing fields from today's date, so its results are not cached
         try:
-            parsed_date = parser.parse(date_string, fuzzy=True)
+            parsed_date = parser.parse(date_string, fuzzy=True, dayfirst=True)
             return parsed_date.strftime("%Y-%m-%d")
         except:
             return None
@@ -177,10 +510,46 @@ class DocumentChatbot:
             print(f"Error collecting user information: {str(e)}")
             return None
 
+    def is_scheduling_request(self, query):
+        """
+        Check whether a query asks to schedule a call.
+
+        Args:
+            query (str): The user's query or request.
+
+        Returns:
+            bool: True if the query mentions scheduling a call, False otherwise.
+        """
+        return next(_SCHEDULING_KEYWORDS.iter(query.lower()), None) is not None
+
+    def schedule_call(self):
+        """
+        Collect the user's information and build the call confirmation message.
+
+        Returns:
+            str: The confirmation message, or an error message if collection failed.
+        """
+        user_info = self.collect_user_info()
+        if user_info:
+            return f"Bot: Thank you, {user_info['name']}! I've scheduled a call for {user_info['appointment_date']}. We'll contact you at {user_info['phone']} or {user_info['email']}."
+        return "Bot: Sorry, there was an error processing your information."
+
     def process_query(self, query):
         """
         Process user queries, determining if they relate to scheduling a call or querying the document.
 
+        Args:
+            query (str): The user's query or request.
+
+        Returns:
+            str: A response generated based on the query.
+        """
+        return "".join(self.stream_query(query))
+
+    async def process_query_async(self, query):
+        """
+        Asynchronous variant of process_query so concurrent sessions can share the Ollama server.
+
         Args:
             query (str): The user's query or request.
 
@@ -189,21 +558,49 @@ class DocumentChatbot:
         """
         try:
             # Check if query is about scheduling a call
-            if any(keyword in query.lower() for keyword in ["call me", "contact me", "schedule", "appointment"]):
-                user_info = self.collect_user_info()
-                if user_info:
-                    return f"Bot: Thank you, {user_info['name']}! I've scheduled a call for {user_info['appointment_date']}. We'll contact you at {user_info['phone']} or {user_info['email']}."
-                return "Bot: Sorry, there was an error processing your information."
-            
+            if self.is_scheduling_request(query):
+                return self.schedule_call()
+
             # Process as document query
-            result = self.qa_chain({
-                "question": query,
-                "chat_history": self.conversation_history
-            })
-            
-            self.conversation_history.append((query, result["answer"]))
-            return result["answer"]
-            
+            chat_history = (await self.memory.aload_memory_variables({}))["chat_history"]
+            answer = ""
+            async for chunk in self.qa_chain.astream({"input": query, "chat_history": chat_history}):
+                answer += chunk.get("answer", "")
+
+            await self.memory.asave_context({"question": query}, {"answer": answer})
+            return answer
+
+        except Exception as e:
+            print(f"Error processing query: {str(e)}")
+            return "Bot: I apologize, but I encountered an error processing your request."
+
+    def stream_query(self, query):
+        """
+        Process a user query like process_query, yielding the answer token by token as the LLM generates it.
+
+        Args:
+            query (str): The user's query or request.
+
+        Yields:
+            str: Successive pieces of the response.
+        """
+        try:
+            # Check if query is about scheduling a call
+            if self.is_scheduling_request(query):
+                yield self.schedule_call()
+                return
+
+            # Process as document query
+            chat_history = self.memory.load_memory_variables({})["chat_history"]
+            answer = ""
+            for chunk in self.qa_chain.stream({"input": query, "chat_history": chat_history}):
+                token = chunk.get("answer")
+                if token:
+                    answer += token
+                    yield token
+
+            self.memory.save_context({"question": query}, {"answer": answer})
+
         except Exception as e:
             print(f"Error processing query: {str(e)}")
-            return "Bot: I apologize, but I encountered an error processing your request."
\ No newline at end of file
+            yield "Bot: I apologize, but I encountered an error processing your request."